@@ -16,5 +16,14 @@ class EventEmitter:
         [function(*args, **kwargs)
          for function in self._callbacks.get(event_name, [])]
 
+    def emitMany(self, event_name: str, items, *args, **kwargs):
+        """
+        Emit event_name once per item, looking up the listeners only once.
+        """
+        functions = self._callbacks.get(event_name, [])
+        for item in items:
+            for function in functions:
+                function(item, *args, **kwargs)
+
     def off(self, event_name: str, function):
         self._callbacks.get(event_name, []).remove(function)
@@ -7,6 +7,7 @@ from redis import Redis
 from bullmq.job import Job
 from bullmq.error_code import ErrorCode
 
+import functools
 import time
 import json
 import msgpack
@@ -30,6 +31,7 @@ class Scripts:
             "moveToActive": redisClient.register_script(self.getScript("moveToActive-9.lua")),
             "moveToFinished": redisClient.register_script(self.getScript("moveToFinished-12.lua")),
             "extendLock": redisClient.register_script(self.getScript("extendLock-2.lua")),
+            "extendLocks": redisClient.register_script(self.getScript("extendLocks-1.lua")),
             "moveStalledJobsToWait": redisClient.register_script(self.getScript("moveStalledJobsToWait-8.lua")),
             "retryJobs": redisClient.register_script(self.getScript("retryJobs-6.lua")),
         }
@@ -47,10 +49,7 @@ class Scripts:
         """ 
         Get a script by name
         """
-        file = open(f"{basePath}/commands/{name}", "r")
-        data = file.read()
-        file.close()
-        return data
+        return loadScript(name)
 
     def getKeys(self, keys: list[str]):
         def mapKey(key):
@@ -115,7 +114,8 @@ class Scripts:
 
     async def moveToActive(self, token: str, opts: dict, jobId: str = "") -> list[Any]:
         """
-        Add an item to the queue
+        Move the next job (or the given jobId if it was already popped) to active,
+        lock it and return its data together with its id in a single reply.
         """
         timestamp = round(time.time() * 1000)
         lockDuration = opts.get("lockDuration", 0)
@@ -186,16 +186,19 @@ class Scripts:
         }, use_bin_type=True)
 
         args = [job.id, timestamp, propVal, val or "", target, "",
-                fetchNext and "fetch" or "", self.keys[''], packedOpts]
+                "1" if fetchNext else "", self.keys[''], packedOpts]
         result = await self.commands["moveToFinished"](keys=keys, args=args)
 
         if result != None:
-            if result < 0:
+            if type(result) == int and result < 0:
                 raise finishedErrors(result, job.id, 'finished', 'active')
             else:
                 # I do not like this as it is using a sideeffect
                 job.finishedOn = timestamp
-            return raw2NextJobData(result)
+            # When fetchNext is set, the script also moves the next job to
+            # active and returns it just like moveToActive does.
+            if type(result) == list:
+                return raw2NextJobData(result)
         return None
 
     def extendLock(self, jobId: str, token: str, duration: int, client: Redis = None):
@@ -203,6 +206,17 @@ class Scripts:
         args = [token, duration, jobId]
         return self.commands["extendLock"](keys, args, client)
 
+    def extendLocks(self, jobIds: list[str], tokens: list[str], duration: int):
+        """
+        Extend the locks of several jobs in one call.
+        Returns the ids of the jobs whose lock could not be extended.
+        """
+        keys = [self.keys['stalled']]
+        args = [self.keys[''], duration]
+        for jobId, token in zip(jobIds, tokens):
+            args.extend([jobId, token])
+        return self.commands["extendLocks"](keys, args)
+
     def moveStalledJobsToWait(self, maxStalledCount: int, stalledInterval: int):
         keys = self.getKeys(['stalled', 'wait', 'active', 'failed',
                             'stalled-check', 'meta', 'paused', 'events'])
@@ -211,6 +225,18 @@ class Scripts:
         return self.commands["moveStalledJobsToWait"](keys, args)
 
 
+@functools.lru_cache(maxsize=None)
+def loadScript(name: str) -> str:
+    """
+    Read a script from disk only once per process, every Queue and Worker
+    shares the same source.
+    """
+    file = open(f"{basePath}/commands/{name}", "r")
+    data = file.read()
+    file.close()
+    return data
+
+
 def finishedErrors(code: int, jobId: str, command: str, state: str) -> TypeError:
     if code == ErrorCode.JobNotExist.value:
         return TypeError(f"Missing key for job {jobId}.{command}")
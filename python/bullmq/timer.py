@@ -14,8 +14,13 @@ class Timer:
 
     async def _job(self):
         try:
+            # Ticks are scheduled on the loop's monotonic clock, so the time
+            # spent in the callback does not delay the next tick.
+            loop = asyncio.get_running_loop()
+            deadline = loop.time()
             while self._ok:
-                await asyncio.sleep(self.interval)
+                deadline = max(deadline + self.interval, loop.time())
+                await asyncio.sleep(deadline - loop.time())
                 await self.callback(*self.args, **self.kwargs)
         except Exception as ex:
             print(ex)
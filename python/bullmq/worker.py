@@ -7,8 +7,24 @@ from bullmq.job import Job
 from bullmq.timer import Timer
 
 import asyncio
-import traceback
-import time
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before fetching again after getNextJob failed
+fetchRetryDelay = 0.1
+
+
+if sys.version_info >= (3, 12):
+    def createTask(coro):
+        """
+        Start a task eagerly, running the coroutine synchronously until its first
+        suspension point, saving the extra trip through the event loop.
+        """
+        return asyncio.eager_task_factory(asyncio.get_running_loop(), coro)
+else:
+    createTask = asyncio.ensure_future
 
 
 class WorkerOptions(TypedDict, total=False):
@@ -76,6 +92,12 @@ class Worker(EventEmitter):
             "maxStalledCount": opts.get("maxStalledCount", 1),
             "stalledInterval": opts.get("stalledInterval", 30000),
         }
+        # self.opts is not modified after construction, so the values read
+        # in the hot paths are resolved once here.
+        self._concurrency = self.opts["concurrency"]
+        self._lockDuration = self.opts["lockDuration"]
+        self._lockRenewIntervalSec = self._lockDuration / 2000
+        self._stalledIntervalSec = self.opts["stalledInterval"] / 1000
         redis_opts = opts.get("connection", {})
         self.redisConnection = RedisConnection(redis_opts)
         self.blockingRedisConnection = RedisConnection(redis_opts)
@@ -87,7 +109,9 @@ class Worker(EventEmitter):
         self.closed = False
         self.running = False
         self.processing = set()
-        self.jobs = set()
+        self.jobs = {}
+        self._doneQueue = asyncio.Queue()
+        self._jobQueue = asyncio.Queue()
 
         if opts.get("autorun", True):
             asyncio.ensure_future(self.run())
@@ -96,42 +120,87 @@ class Worker(EventEmitter):
         if self.running:
             raise Exception("Worker is already running")
 
-        self.timer = Timer(
-            (self.opts.get("lockDuration") / 2) / 1000, self.extendLocks)
-        self.stalledCheckTimer = Timer(self.opts.get(
-            "stalledInterval") / 1000, self.runStalledJobsCheck)
+        self.timer = Timer(self._lockRenewIntervalSec, self.extendLocks)
+        self.stalledCheckTimer = Timer(
+            self._stalledIntervalSec, self.runStalledJobsCheck)
         self.running = True
-        job = None
         token = uuid4().hex
 
-        while not self.closed:
-            if not job and len(self.processing) < self.opts.get("concurrency") and not self.closing:
-                waiting_job = asyncio.ensure_future(self.getNextJob(token))
-                self.processing.add(waiting_job)
-
-            if job:
-                processing_job = asyncio.ensure_future(
-                    self.processJob(job, token))
-                self.processing.add(processing_job)
-
-            try:
-                job, pending = await getFirstCompleted(self.processing)
-                self.processing = pending
-
-                if (job is None or len(self.processing) == 0) and self.closing:
-                    # We are done processing so we can close the queue
-                    break
-
-            except Exception as e:
-                # This should never happen or we will have an endless loop
-                print("ERROR:", e)
-                traceback.print_exc()
-                return
+        # A single long lived fetcher takes care of getting jobs from Redis,
+        # so that dispatching them does not spawn a new task per fetch.
+        fetcher = createTask(self.fetchJobs(token))
 
+        while not self.closed:
+            job = await self._jobQueue.get()
+            if job is None or self.forceClosing:
+                # The fetcher has stopped because we are closing. When force
+                # closing, jobs still queued are left to the stalled checker.
+                break
+            self.addTask(self.processJob(job, token))
+
+        # Jobs in progress may still fetch a job from moveToFinished, which is
+        # then locked by this worker. Unless force closing, wait for them and
+        # process whatever they fetched before stopping the timers.
+        while not self.forceClosing and (self.processing or not self._jobQueue.empty()):
+            if self._jobQueue.empty():
+                await self._doneQueue.get()
+            else:
+                self.addTask(self.processJob(
+                    self._jobQueue.get_nowait(), token))
+
+        await fetcher
         self.running = False
         self.timer.stop()
         self.stalledCheckTimer.stop()
 
+    def addTask(self, coro):
+        task = createTask(coro)
+        self.processing.add(task)
+        task.add_done_callback(self.onTaskDone)
+
+    def onTaskDone(self, task: asyncio.Task):
+        # Keep the processing set up to date in place and wake up the fetcher
+        # in case it is waiting for a free slot.
+        self.processing.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error("Error running worker task",
+                         exc_info=task.exception())
+        self._doneQueue.put_nowait(task)
+
+    async def fetchJobs(self, token: str):
+        """
+        Fetches jobs into the job queue as long as there is spare concurrency,
+        until the worker is closing.
+        @param token: worker token to be assigned to retrieved jobs
+        """
+        try:
+            while not self.closing:
+                if len(self.processing) + self._jobQueue.qsize() >= self._concurrency:
+                    # Tasks push themselves into the done queue when they
+                    # finish, so waiting for a free slot does not depend on
+                    # how many tasks are in flight.
+                    await self._doneQueue.get()
+                    # Consume every other completion of the same wakeup at
+                    # once instead of one loop iteration per task.
+                    while not self._doneQueue.empty():
+                        self._doneQueue.get_nowait()
+                    continue
+
+                try:
+                    job = await self.getNextJob(token)
+                except Exception:
+                    logger.exception("Error fetching next job")
+                    # Back off so that a persistent failure (e.g. Redis being
+                    # unreachable) does not turn into a busy loop.
+                    if not self.closing:
+                        await asyncio.sleep(fetchRetryDelay)
+                    continue
+
+                if job:
+                    self._jobQueue.put_nowait(job)
+        finally:
+            self._jobQueue.put_nowait(None)
+
     async def getNextJob(self, token: str):
         """
         Returns a promise that resolves to the next job in queue.
@@ -142,73 +211,98 @@ class Worker(EventEmitter):
         result = await self.scripts.moveToActive(token, self.opts)
         job = None
         job_id = None
-        delay_until = None
         if result:
             job, job_id = result
 
-        # If there are no jobs in the waiting list we keep waiting with BRPOPLPUSH
+        # If there are no jobs in the waiting list we keep waiting with BRPOPLPUSH.
+        # BLMOVE would need Redis >= 6.2, while Redis >= 5.0.0 is supported.
         if job is None:
-            timeout = min(delay_until - int(time.time() * 1000)
-                          if delay_until else 5000, 5000) / 1000
+            # Only Redis >= 6 accepts fractional block timeouts, so keep it
+            # an integer number of seconds.
+            timeout = 5
             job_id = await self.bclient.brpoplpush(self.scripts.keys["wait"], self.scripts.keys["active"], timeout)
             if job_id:
-                job, job_id = await self.scripts.moveToActive(token, self.opts, job_id)
+                # moveToActive locks the popped job and replies with its data,
+                # so no further round trip is needed to hydrate it.
+                result = await self.scripts.moveToActive(token, self.opts, job_id)
+                if result:
+                    job, job_id = result
 
         if job and job_id:
             return Job.fromJSON(self.client, job, job_id)
 
     async def processJob(self, job: Job, token: str):
         try:
-            self.jobs.add((job, token))
+            self.jobs[job.id] = (job, token)
             result = await self.processor(job, token)
             if not self.forceClosing:
-                await self.scripts.moveToCompleted(job, result, job.opts.get("removeOnComplete", True), token, self.opts, fetchNext=not self.closing)
+                nextJobData = await self.scripts.moveToCompleted(job, result, job.removeOnComplete, token, self.opts, fetchNext=not self.closing)
+                self.queueNextJob(nextJobData)
             self.emit("completed", job, result)
         except Exception as err:
             try:
-                print("Error processing job", err)
-                stacktrace = traceback.format_exc()
+                logger.exception("Error processing job %s", job.id)
 
                 if not self.forceClosing:
-                    await self.scripts.moveToFailed(job, str(err), job.opts.get("removeOnFail", False), token, self.opts, fetchNext=not self.closing)
+                    nextJobData = await self.scripts.moveToFailed(job, str(err), job.removeOnFail, token, self.opts, fetchNext=not self.closing)
+                    self.queueNextJob(nextJobData)
 
                 # TODO: Store the stacktrace in the job
 
                 self.emit("failed", job, err)
             except Exception as err:
-                print("Error moving job to failed", err)
+                logger.exception("Error moving job %s to failed", job.id)
                 self.emit("error", err, job)
         finally:
-            self.jobs.remove((job, token))
+            # The same job may have been fetched again by another processJob
+            # (e.g. after losing its lock), only remove our own entry.
+            if self.jobs.get(job.id) == (job, token):
+                self.jobs.pop(job.id, None)
+
+    def queueNextJob(self, nextJobData):
+        """
+        Queue the job fetched by moveToFinished so that it is processed
+        without another round trip through getNextJob.
+        """
+        if nextJobData:
+            jobData, jobId = nextJobData
+            if jobData and jobId:
+                self._jobQueue.put_nowait(
+                    Job.fromJSON(self.client, jobData, jobId))
 
     async def extendLocks(self):
         # Renew all the locks for the jobs that are still active
         try:
-            multi = self.client.pipeline()
-            for job, token in self.jobs:
-                await self.scripts.extendLock(job.id, token, self.opts.get("lockDuration"), multi)
-            result = await multi.execute()
+            if len(self.jobs) == 0:
+                return
 
-            # result includes an object with locks that may not have been renewed.
-            # We should emit an error for each of those jobs.
-            #    for jobId, err in result.items():
-            #    self.emit("error", "could not renew lock for job " + jobId)
+            jobIds = []
+            tokens = []
+            for job, token in self.jobs.values():
+                jobIds.append(job.id)
+                tokens.append(token)
+            failed = await self.scripts.extendLocks(jobIds, tokens, self._lockDuration)
 
-        except Exception as e:
-            print("Error renewing locks", e)
-            traceback.print_exc()
+            for jobId in failed:
+                # Jobs that finished while we were extending the locks had
+                # their lock released by moveToFinished, that is not an error.
+                if jobId not in self.jobs:
+                    continue
+                self.emit("error", Exception(
+                    f"could not renew lock for job {jobId}"))
+
+        except Exception:
+            logger.exception("Error renewing locks")
 
     async def runStalledJobsCheck(self):
         try:
             failed, stalled = await self.scripts.moveStalledJobsToWait(self.opts.get("maxStalledCount"), self.opts.get("stalledInterval"))
-            for jobId in failed:
-                self.emit("failed", jobId,
+            self.emitMany("failed", failed,
                           "job stalled more than allowable limit")
-            for jobId in stalled:
-                self.emit("stalled", jobId)
+            self.emitMany("stalled", stalled)
 
         except Exception as e:
-            print("Error checking stalled jobs", e)
+            logger.exception("Error checking stalled jobs")
             self.emit('error', e)
 
     async def close(self, force: bool = False):
@@ -220,17 +314,12 @@ class Worker(EventEmitter):
 
         self.closing = True
 
-        await self.blockingRedisConnection.close()
-        await self.redisConnection.close()
+        # When force closing, stop renewing locks and checking for stalled
+        # jobs before closing the connections these timers use. Otherwise
+        # the jobs in progress still need their locks, and run stops the
+        # timers once they have finished.
+        if force and self.running:
+            self.timer.stop()
+            self.stalledCheckTimer.stop()
 
-
-async def getFirstCompleted(taskSet: set):
-    jobSet, pending = await asyncio.wait(taskSet, return_when=asyncio.FIRST_COMPLETED)
-    for jobTask in jobSet:
-        try:
-            job = jobTask.result()
-            return (job, pending)
-        except Exception as e:
-            print("ERROR:", e)
-            traceback.print_exc()
-            return pending
+        await asyncio.gather(self.blockingRedisConnection.close(), self.redisConnection.close())
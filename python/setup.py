@@ -21,6 +21,7 @@ setup(
     packages=['bullmq'],
     package_data={'bullmq': ['commands/*.lua']},
     install_requires=['redis',
+                      'hiredis',
                       'msgpack',            
                       ],
     classifiers=[
@@ -50,6 +50,73 @@ class TestWorker(unittest.IsolatedAsyncioTestCase):
         await queue.close()
         
 
+    async def test_process_jobs_fetched_on_completion(self):
+        queue = Queue(queueName)
+        data = {"foo": "bar"}
+        job1 = await queue.add("test-job", data, { "removeOnComplete": False })
+        job2 = await queue.add("test-job", data, { "removeOnComplete": False })
+
+        async def process(job: Job, token: str):
+            return "done"
+
+        worker = Worker(queueName, process, { "autorun": False })
+
+        # Record the jobs obtained through getNextJob, the second job must
+        # come from the moveToFinished reply instead.
+        fetched = []
+        getNextJob = worker.getNextJob
+        async def recordingGetNextJob(token: str):
+            job = await getNextJob(token)
+            if job:
+                fetched.append(job.id)
+            return job
+        worker.getNextJob = recordingGetNextJob
+
+        asyncio.ensure_future(worker.run())
+
+        completed = []
+        processing = Future()
+        def onCompleted(job, result):
+            completed.append(job.id)
+            if len(completed) == 2:
+                processing.set_result(None)
+        worker.on("completed", onCompleted)
+
+        await processing
+
+        self.assertEqual(completed, [job1.id, job2.id])
+        self.assertEqual(fetched, [job1.id])
+
+        completedJob = await Job.fromId(queue, job2.id)
+        self.assertEqual(completedJob.attemptsMade, 1)
+        self.assertEqual(completedJob.returnvalue, "done")
+
+        await worker.close()
+        await queue.close()
+
+    async def test_fetch_retries_with_delay(self):
+        async def process(job: Job, token: str):
+            return "done"
+
+        worker = Worker(queueName, process, { "autorun": False })
+
+        calls = 0
+        async def failingGetNextJob(token: str):
+            nonlocal calls
+            calls += 1
+            raise ConnectionError("Connection lost")
+        worker.getNextJob = failingGetNextJob
+
+        running = asyncio.ensure_future(worker.run())
+        await asyncio.sleep(0.5)
+
+        # One attempt per retry delay, instead of spinning on the error
+        self.assertGreater(calls, 1)
+        self.assertLessEqual(calls, 10)
+
+        await worker.close()
+        await running
+
     async def test_process_jobs_fail(self):
         queue = Queue(queueName)
         data = {"foo": "bar"}
@@ -109,6 +176,35 @@ class TestWorker(unittest.IsolatedAsyncioTestCase):
         await worker.close()
         await queue.close()
 
+    async def test_extend_locks_reports_lost_locks(self):
+        async def process(job: Job, token: str):
+            return "done"
+
+        worker = Worker(queueName, process, { "autorun": False })
+
+        # Neither job holds a lock in Redis, so both renewals fail
+        lostJob = Job(worker.client, "test-job", {}, { "jobId": "1" })
+        finishedJob = Job(worker.client, "test-job", {}, { "jobId": "2" })
+        worker.jobs[lostJob.id] = (lostJob, "token")
+        worker.jobs[finishedJob.id] = (finishedJob, "token")
+
+        # Simulate the second job finishing while the locks are extended
+        extendLocks = worker.scripts.extendLocks
+        async def finishingExtendLocks(jobIds, tokens, duration):
+            failed = await extendLocks(jobIds, tokens, duration)
+            del worker.jobs[finishedJob.id]
+            return failed
+        worker.scripts.extendLocks = finishingExtendLocks
+
+        errors = []
+        worker.on("error", lambda err: errors.append(str(err)))
+
+        await worker.extendLocks()
+
+        self.assertEqual(errors, ["could not renew lock for job 1"])
+
+        await worker.close()
+
     async def test_process_stalled_jobs(self):
         queue = Queue(queueName)
         data = {"foo": "bar"}
@@ -0,0 +1,33 @@
+--[[
+  Extend the locks of several jobs at once and remove them from the stalled set.
+
+  Input:
+    KEYS[1] 'stalled'
+
+    ARGV[1]  key prefix
+    ARGV[2]  lock duration in milliseconds
+    ARGV[3..] jobId, token pairs
+
+  Output:
+    List of job ids whose lock could not be extended.
+]]
+local rcall = redis.call
+local stalledKey = KEYS[1]
+local keyPrefix = ARGV[1]
+local lockDuration = ARGV[2]
+local failed = {}
+
+for i = 3, #ARGV, 2 do
+  local jobId = ARGV[i]
+  local token = ARGV[i + 1]
+  local lockKey = keyPrefix .. jobId .. ":lock"
+
+  if rcall("GET", lockKey) == token and
+    rcall("SET", lockKey, token, "PX", lockDuration) then
+    rcall("SREM", stalledKey, jobId)
+  else
+    table.insert(failed, jobId)
+  end
+end
+
+return failed
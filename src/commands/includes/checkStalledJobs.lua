@@ -34,9 +34,11 @@ local function checkStalledJobs(stalledKey, waitKey, activeKey, failedKey,
                                 stalledCheckKey, metaKey, pausedKey,
                                 eventStreamKey, maxStalledJobCount,
                                 queueKeyPrefix, timestamp, maxCheckTime)
-    if rcall("EXISTS", stalledCheckKey) == 1 then return {{}, {}} end
-
-    rcall("SET", stalledCheckKey, timestamp, "PX", maxCheckTime)
+    -- Only the first caller within maxCheckTime acquires the check key,
+    -- everybody else returns right away.
+    if not rcall("SET", stalledCheckKey, timestamp, "NX", "PX", maxCheckTime) then
+        return {{}, {}}
+    end
 
     -- Trim events before emiting them to avoid trimming events emitted in this script
     trimEvents(metaKey, eventStreamKey)